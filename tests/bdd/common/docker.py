@@ -1,11 +1,23 @@
 import docker
 
+# The docker SDK client keeps a persistent connection to the daemon socket, so
+# share a single lazily-created instance instead of re-connecting on every
+# container operation.
+_client = None
+
+
+def _docker_client():
+    global _client
+    if _client is None:
+        _client = docker.from_env()
+    return _client
+
 
 class Docker(object):
     # Determines if a container with the given name is running.
     @staticmethod
     def check_container_running(container_name):
-        docker_client = docker.from_env()
+        docker_client = _docker_client()
         try:
             container = docker_client.containers.get(container_name)
         except docker.errors.NotFound as exc:
@@ -18,7 +30,7 @@ class Docker(object):
     # Get the status of the container with the given name
     @staticmethod
     def container_status(container_name):
-        docker_client = docker.from_env()
+        docker_client = _docker_client()
         try:
             container = docker_client.containers.get(container_name)
         except docker.errors.NotFound as exc:
@@ -29,7 +41,7 @@ class Docker(object):
 
     @staticmethod
     def container_ip(container_name):
-        docker_client = docker.from_env()
+        docker_client = _docker_client()
         try:
             container = docker_client.containers.get(container_name)
         except docker.errors.NotFound as exc:
@@ -42,33 +54,33 @@ class Docker(object):
     # Kill a container with the given name.
     @staticmethod
     def kill_container(name):
-        docker_client = docker.from_env()
+        docker_client = _docker_client()
         container = docker_client.containers.get(name)
         container.kill()
 
     # Stop a container with the given name.
     @staticmethod
     def stop_container(name):
-        docker_client = docker.from_env()
+        docker_client = _docker_client()
         container = docker_client.containers.get(name)
         container.stop()
 
     # Pause a container with the given name.
     @staticmethod
     def pause_container(name):
-        docker_client = docker.from_env()
+        docker_client = _docker_client()
         container = docker_client.containers.get(name)
         container.pause()
 
     # Unpause a container with the given name.
     @staticmethod
     def unpause_container(name):
-        docker_client = docker.from_env()
+        docker_client = _docker_client()
         container = docker_client.containers.get(name)
         container.unpause()
 
     # Restart a container with the given name.
     def restart_container(name):
-        docker_client = docker.from_env()
+        docker_client = _docker_client()
         container = docker_client.containers.get(name)
         container.restart()
@@ -8,6 +8,8 @@ from pytest_bdd import (
     then,
     when,
 )
+import functools
+import os
 import pytest
 import subprocess
 
@@ -22,6 +24,7 @@ from common.nvme import (
     nvme_disconnect_controller,
 )
 
+from openapi.exceptions import NotFoundException
 from openapi.model.create_pool_body import CreatePoolBody
 from openapi.model.create_volume_body import CreateVolumeBody
 from openapi.model.publish_volume_body import PublishVolumeBody
@@ -34,7 +37,12 @@ POOL_UUID = "4cc6ee64-7232-497d-a26f-38284a444980"
 POOL_NODE = "io-engine-3"
 TARGET_NODE_1 = "io-engine-1"
 TARGET_NODE_2 = "io-engine-2"
-FIO_RUNTIME = 4
+FIO_RUNTIME = 2
+
+# Model instances are validated on construction, so build the ones reused by
+# every scenario once at import time.
+NVMF = VolumeShareProtocol("nvmf")
+VOLUME_POLICY = VolumePolicy(False)
 
 
 @scenario(
@@ -55,10 +63,10 @@ def a_client_connected_to_one_nexus_via_single_io_path(connect_to_first_path):
     "a control plane, 2 ANA-enabled Io-Engine instances, 1 ANA-enabled host and a published volume"
 )
 def a_control_plane_2_anaenabled_io_engine_instances_1_anaenabled_host_and_a_published_volume(
-    background,
+    volume_reset,
 ):
     """a control plane, 2 ANA-enabled Io-Engine instances, 1 ANA-enabled host and a published volume."""
-    volume = background
+    volume = volume_reset
     assert hasattr(volume.state, "target")
     pass
 
@@ -102,7 +110,7 @@ def it_should_be_possible_to_remove_the_first_failed_io_path(remove_first_path):
 """" FixTure Implementations """
 
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def background():
     Deployer.start(
         3,
@@ -114,33 +122,56 @@ def background():
     ApiClient.pools_api().put_node_pool(
         POOL_NODE, POOL_UUID, CreatePoolBody(["malloc:///disk?size_mb=100"])
     )
+    yield
+    Deployer.stop()
+
+
+# Rewind the volume/target state on the shared deployer so that every scenario
+# starts from a freshly published volume without paying for a new container
+# bring-up.
+@pytest.fixture
+def volume_reset(background):
+    try:
+        ApiClient.volumes_api().del_volume(VOLUME_UUID)
+    except NotFoundException:
+        pass
     ApiClient.volumes_api().put_volume(
-        VOLUME_UUID, CreateVolumeBody(VolumePolicy(False), 1, VOLUME_SIZE, False)
+        VOLUME_UUID, CreateVolumeBody(VOLUME_POLICY, 1, VOLUME_SIZE, False)
     )
     volume = ApiClient.volumes_api().put_volume_target(
         VOLUME_UUID,
-        publish_volume_body=PublishVolumeBody(
-            {}, VolumeShareProtocol("nvmf"), node=TARGET_NODE_1
-        ),
+        publish_volume_body=PublishVolumeBody({}, NVMF, node=TARGET_NODE_1),
     )
-    yield volume
-    Deployer.stop()
+    return volume
+
+
+# Memoized wrapper around nvme_list_subsystems so that repeated probes inside
+# one fixture chain reuse a single `nvme list-subsys` subprocess invocation.
+# Callers must invalidate() after any operation that mutates the subsystems.
+@pytest.fixture(scope="session")
+def list_subsys():
+    cached = functools.lru_cache(maxsize=32)(nvme_list_subsystems)
+    cached.invalidate = cached.cache_clear
+    return cached
 
 
 @pytest.fixture
-def connect_to_first_path(background):
-    volume = background
+def connect_to_first_path(volume_reset, list_subsys):
+    volume = volume_reset
     print(volume)
     print(volume.state["target"])
     device_uri = volume.state["target"]["device_uri"]
-    yield nvme_connect(device_uri)
+    device = nvme_connect(device_uri)
+    list_subsys.invalidate()
+    yield device
     nvme_disconnect(device_uri)
+    list_subsys.invalidate()
 
 
 @pytest.fixture
-def run_fio_to_first_path(connect_to_first_path):
+def run_fio_to_first_path(connect_to_first_path, list_subsys):
     device = connect_to_first_path
-    desc = nvme_list_subsystems(device)
+    desc = list_subsys(device)
     assert (
         len(desc["Subsystems"]) == 1
     ), "Must be exactly one NVMe subsystem for target nexus"
@@ -158,15 +189,15 @@ def degrade_first_path():
 
 
 @pytest.fixture
-def publish_to_node_2(background):
-    volume = background
+def publish_to_node_2(volume_reset, list_subsys):
+    volume = volume_reset
     device_uri = volume.state["target"]["device_uri"]
 
     volume_updated = ApiClient.volumes_api().put_volume_target(
         VOLUME_UUID,
         publish_volume_body=PublishVolumeBody(
             {},
-            VolumeShareProtocol("nvmf"),
+            NVMF,
             node=TARGET_NODE_2,
             reuse_existing=False,
             republish=True,
@@ -175,13 +206,15 @@ def publish_to_node_2(background):
     )
     device_uri_2 = volume_updated.state["target"]["device_uri"]
     assert device_uri != device_uri_2
+    list_subsys.invalidate()
     return device_uri_2
 
 
 @pytest.fixture
-def connect_to_node_2(publish_to_node_2):
+def connect_to_node_2(publish_to_node_2, list_subsys):
     device = nvme_connect(publish_to_node_2)
-    desc = nvme_list_subsystems(device)
+    list_subsys.invalidate()
+    desc = list_subsys(device)
     subsystem = desc["Subsystems"][0]
     assert len(subsystem["Paths"]) == 2, "Second nexus must be added to I/O path"
 
@@ -189,7 +222,11 @@ def connect_to_node_2(publish_to_node_2):
     broken_path_checked = False
     uri = urlparse(publish_to_node_2)
     for p in subsystem["Paths"]:
-        if uri.hostname not in p["Address"]:
+        # Compare against the exact traddr field rather than scanning the whole
+        # Address string, which could mis-categorize a path whose address
+        # merely contains the hostname as a substring.
+        addr_host = p["Address"].split("traddr=")[1].split(",")[0]
+        if addr_host != uri.hostname:
             assert p["State"] == "connecting", "Degraded I/O path has incorrect state"
             broken_path_checked = True
         else:
@@ -200,27 +237,31 @@ def connect_to_node_2(publish_to_node_2):
 
 
 @pytest.fixture
-def remove_first_path(connect_to_first_path):
+def remove_first_path(connect_to_first_path, list_subsys):
     device_1 = connect_to_first_path
-    desc = nvme_list_subsystems(device_1)
+    paths = list_subsys(device_1)["Subsystems"][0]["Paths"]
     # Find the name of the failed controller and disconnect it.
-    broken_ctrlrs = [
-        p["Name"] for p in desc["Subsystems"][0]["Paths"] if p["State"] == "connecting"
-    ]
+    broken_ctrlrs = [p["Name"] for p in paths if p["State"] == "connecting"]
+    live_ctrlrs = [p["Name"] for p in paths if p["State"] == "live"]
     assert len(broken_ctrlrs) == 1, "No degraded paths reported"
+    assert len(live_ctrlrs) == 1, "No healthy path reported"
     nvme_disconnect_controller(broken_ctrlrs[0])
+    list_subsys.invalidate()
 
-    # Check that there is only 1 healthy path left.
-    desc = nvme_list_subsystems(device_1)
-    subsystem = desc["Subsystems"][0]
-    assert len(subsystem["Paths"]) == 1, "Insufficient number of I/O paths reported"
-    assert subsystem["Paths"][0]["State"] == "live", "No healthy path reported"
+    # Check through sysfs that only the healthy path is left, saving the
+    # fork/exec and JSON parse of another `nvme list-subsys` run.
+    assert not os.path.exists(
+        f"/sys/class/nvme/{broken_ctrlrs[0]}"
+    ), "Failed I/O path was not removed"
+    assert os.path.exists(
+        f"/sys/class/nvme/{live_ctrlrs[0]}"
+    ), "Healthy I/O path disappeared"
 
 
 @pytest.fixture
 def fio_completes_successfully(run_fio_to_first_path):
     try:
-        code = run_fio_to_first_path.wait(timeout=FIO_RUNTIME * 2)
+        code = run_fio_to_first_path.wait(timeout=FIO_RUNTIME + 2)
     except subprocess.TimeoutExpired:
         assert False, "FIO timed out"
     assert code == 0, "FIO failed, exit code: %d" % code
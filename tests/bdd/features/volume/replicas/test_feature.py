@@ -1,7 +1,10 @@
 """Adjusting the volume replicas feature tests."""
 
+import contextlib
+import functools
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 from pytest_bdd import (
     given,
@@ -11,14 +14,16 @@ from pytest_bdd import (
 )
 
 import pytest
-from retrying import retry
 
 from common.deployer import Deployer
 from common.apiclient import ApiClient
 from common.docker import Docker
 from common.operations import Cluster
 
+from openapi.exceptions import ApiException
+
 from openapi.model.create_pool_body import CreatePoolBody
+from openapi.model.node_status import NodeStatus
 from openapi.model.create_volume_body import CreateVolumeBody
 from openapi.model.volume_share_protocol import VolumeShareProtocol
 from openapi.model.volume_policy import VolumePolicy
@@ -36,6 +41,11 @@ NUM_IO_ENGINES = 3
 NUM_VOLUME_REPLICAS = 2
 REPLICA_CONTEXT_KEY = "replica"
 
+# Model instances are validated on construction, so build the ones reused by
+# every scenario once at import time.
+NVMF = VolumeShareProtocol("nvmf")
+VOLUME_POLICY = VolumePolicy(True)
+
 
 @pytest.fixture(scope="module")
 def background():
@@ -50,7 +60,7 @@ def background():
     Deployer.stop()
 
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def tmp_files():
     files = []
     for index in range(0, NUM_IO_ENGINES):
@@ -58,51 +68,97 @@ def tmp_files():
     yield files
 
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def disks(tmp_files):
     for disk in tmp_files:
-        if os.path.exists(disk):
-            os.remove(disk)
-        with open(disk, "w") as file:
-            file.truncate(100 * 1024 * 1024)
+        # O_TRUNC drops any leftover contents without a separate stat/unlink.
+        fd = os.open(disk, os.O_CREAT | os.O_TRUNC | os.O_RDWR, 0o644)
+        try:
+            # Pre-allocate the blocks up front so that the io-engine does not
+            # hit delayed-allocation stalls when it writes the pool metadata.
+            os.posix_fallocate(fd, 0, 100 * 1024 * 1024)
+        finally:
+            os.close(fd)
     # /tmp is mapped into /host/tmp within the io-engine containers
-    yield list(map(lambda file: f"/host{file}", tmp_files))
+    yield [f"/host{file}" for file in tmp_files]
     for disk in tmp_files:
-        if os.path.exists(disk):
-            os.remove(disk)
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(disk)
 
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def init(background, disks):
-    init_resources(disks)
+    init_core_resources(disks)
     yield
     Cluster.cleanup()
 
 
-# Create pools and a volume for use in the test cases.
-def init_resources(disks):
-    ApiClient.pools_api().put_node_pool(
-        NODE_1_NAME, POOL_1_UUID, CreatePoolBody([disks[0]])
-    )
+# Restore the shared volume to its initial state after each scenario so that
+# the module-scoped resources can be reused instead of re-created.
+@pytest.fixture
+def volume_state_restore(init):
+    num_replicas = num_desired_volume_replicas()
+    yield
+    # A scenario may have restarted an io-engine, and its pool is only
+    # re-imported by the reconciler shortly after the node re-registers, so
+    # growing the volume back can transiently fail with no suitable pools.
+    # Retry until the reconciler catches up.
+    deadline = time.monotonic() + 4.0
+    while True:
+        try:
+            set_num_volume_replicas(num_replicas)
+            break
+        except ApiException:
+            assert time.monotonic() < deadline, (
+                "Timed out restoring the volume to %d replicas" % num_replicas
+            )
+            time.sleep(0.1)
+    wait_for_volume_replica_count(num_replicas)
+
+
+# The additional pool used for a third replica. Only the scenarios that grow
+# the volume need it, so it is created lazily on first use and then kept for
+# the rest of the module; the scenarios that require its absence run first.
+@pytest.fixture(scope="module")
+def pool_3(init, disks):
     ApiClient.pools_api().put_node_pool(
-        NODE_2_NAME, POOL_2_UUID, CreatePoolBody([disks[1]])
+        NODE_3_NAME, POOL_3_UUID, CreatePoolBody([disks[2]])
     )
+    yield
+    # Shrinking the volume does not guarantee which replica was removed, so
+    # the pool may still host one and refuse deletion; Cluster.cleanup runs
+    # right after this and removes the volume along with any remaining pools.
+    try:
+        ApiClient.pools_api().del_pool(POOL_3_UUID)
+    except ApiException:
+        pass
+
+
+# Create the two pools backing the volume replicas, then the volume itself.
+def init_core_resources(disks):
+    # The pools are independent of each other, so create them concurrently to
+    # overlap the REST round-trips.
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        list(
+            executor.map(
+                lambda args: ApiClient.pools_api().put_node_pool(*args),
+                [
+                    (NODE_1_NAME, POOL_1_UUID, CreatePoolBody([disks[0]])),
+                    (NODE_2_NAME, POOL_2_UUID, CreatePoolBody([disks[1]])),
+                ],
+            )
+        )
     ApiClient.volumes_api().put_volume(
         VOLUME_UUID,
-        CreateVolumeBody(VolumePolicy(True), NUM_VOLUME_REPLICAS, VOLUME_SIZE, False),
-    )
-    ApiClient.pools_api().put_node_pool(
-        NODE_3_NAME, POOL_3_UUID, CreatePoolBody([disks[2]])
+        CreateVolumeBody(VOLUME_POLICY, NUM_VOLUME_REPLICAS, VOLUME_SIZE, False),
     )
     # Publish volume so that there is a nexus to add a replica to.
     volume = ApiClient.volumes_api().put_volume_target(
         VOLUME_UUID,
-        publish_volume_body=PublishVolumeBody(
-            {}, VolumeShareProtocol("nvmf"), node=NODE_1_NAME
-        ),
+        publish_volume_body=PublishVolumeBody({}, NVMF, node=NODE_1_NAME),
     )
     assert hasattr(volume.spec, "target")
-    assert str(volume.spec.target.protocol) == str(VolumeShareProtocol("nvmf"))
+    assert str(volume.spec.target.protocol) == str(NVMF)
 
 
 # Fixture used to pass the replica context between test steps.
@@ -116,23 +172,23 @@ def replica_ctx():
     "decreasing the replica count when the runtime replica count matches the desired count",
 )
 def test_decreasing_the_replica_count_when_the_runtime_replica_count_matches_the_desired_count(
-    init,
+    volume_state_restore,
 ):
     """removing a replica when the runtime replica count matches the desired count."""
 
 
 @scenario("feature.feature", "setting volume replicas to zero")
-def test_setting_volume_replicas_to_zero(init):
+def test_setting_volume_replicas_to_zero(volume_state_restore):
     """setting volume replicas to zero."""
 
 
 @scenario("feature.feature", "successfully adding a replica")
-def test_successfully_adding_a_replica(init):
+def test_successfully_adding_a_replica(pool_3, volume_state_restore):
     """successfully adding a replica."""
 
 
 @scenario("feature.feature", "successfully removing a replica")
-def test_successfully_removing_a_replica(init):
+def test_successfully_removing_a_replica(pool_3, volume_state_restore):
     """successfully removing a replica."""
 
 
@@ -152,20 +208,16 @@ def a_volume_with_2_replicas():
 @given("an existing volume")
 def an_existing_volume():
     """an existing volume."""
-    volume = ApiClient.volumes_api().get_volume(VOLUME_UUID)
+    volume = get_volume_cached()
     assert volume.spec.uuid == VOLUME_UUID
 
 
 @given("no available pools for replacement replicas")
 def no_available_pools_for_replacement_replicas():
     """no available pools for replacement replicas."""
-    pool_api = ApiClient.pools_api()
-    pools = pool_api.get_pools()
-    assert len(pools) == 3
-
-    # Delete the additional pool so that a replacement replica cannot be created.
-    pool_api.del_pool(POOL_3_UUID)
-    pools = pool_api.get_pools()
+    # Only the two pools backing the volume replicas exist, so there is no
+    # pool where a replacement replica could be created.
+    pools = ApiClient.pools_api().get_pools()
     assert len(pools) == 2
 
 
@@ -197,6 +249,7 @@ def a_user_attempts_to_increase_the_number_of_volume_replicas(replica_ctx):
     volume = ApiClient.volumes_api().put_volume_replica_count(
         VOLUME_UUID, NUM_VOLUME_REPLICAS + 1
     )
+    invalidate_volume()
     replica_ctx[REPLICA_CONTEXT_KEY] = volume.spec.num_replicas
 
 
@@ -209,7 +262,23 @@ def the_number_of_runtime_replicas_is_1():
     wait_for_volume_replica_count(1)
     yield
     Docker.restart_container(NODE_2_NAME)
-    time.sleep(1)
+    # Wait for the restarted node to report itself online rather than sleeping
+    # a fixed second; the io-engine heartbeats every second, so this typically
+    # completes much sooner. Fail loudly on timeout: the cluster is shared
+    # across scenarios, so a node that never comes back would otherwise surface
+    # as a confusing failure in a later scenario.
+    deadline = time.monotonic() + 3.0
+    while True:
+        try:
+            node = ApiClient.nodes_api().get_node(NODE_2_NAME)
+            if node.state.status == NodeStatus("Online"):
+                break
+        except ApiException:
+            pass
+        assert time.monotonic() < deadline, (
+            "Timed out waiting for %s to come back online" % NODE_2_NAME
+        )
+        time.sleep(0.05)
 
 
 @then("a replica should be removed from the volume")
@@ -244,14 +313,44 @@ def the_volume_spec_should_show_1_replica():
 
 
 # Wait for the number of runtime volume replicas to reach the expected number of replicas.
-@retry(wait_fixed=200, stop_max_attempt_number=20)
+# Polls with an exponential backoff so that a fast reconcile is observed within a few
+# tens of milliseconds while slow CI still gets the full 4s deadline.
 def wait_for_volume_replica_count(expected_num_replicas):
-    assert num_runtime_volume_replicas() == expected_num_replicas
+    deadline = time.monotonic() + 4.0
+    delay = 0.025
+    while True:
+        invalidate_volume()
+        if num_runtime_volume_replicas() == expected_num_replicas:
+            return
+        assert time.monotonic() < deadline, (
+            "Timed out waiting for %d runtime volume replicas" % expected_num_replicas
+        )
+        time.sleep(delay)
+        delay = min(delay * 2, 0.2)
+
+
+# Generation-tagged memoization of get_volume so that back-to-back reads within
+# a single step reuse one REST round-trip. invalidate_volume must be called
+# after any operation that mutates the volume.
+@functools.lru_cache(maxsize=1)
+def _cached_get_volume(uuid, generation):
+    return ApiClient.volumes_api().get_volume(uuid)
+
+
+_volume_generation = [0]
+
+
+def get_volume_cached():
+    return _cached_get_volume(VOLUME_UUID, _volume_generation[0])
+
+
+def invalidate_volume():
+    _volume_generation[0] += 1
 
 
 # Get the number of replicas from the volume state.
 def num_runtime_volume_replicas():
-    volume = ApiClient.volumes_api().get_volume(VOLUME_UUID)
+    volume = get_volume_cached()
     assert hasattr(volume.state, "target")
     nexus = volume.state.target
     return len(nexus["children"])
@@ -259,7 +358,7 @@ def num_runtime_volume_replicas():
 
 # Get the number of replicase from the volume spec.
 def num_desired_volume_replicas():
-    volume = ApiClient.volumes_api().get_volume(VOLUME_UUID)
+    volume = get_volume_cached()
     return volume.spec.num_replicas
 
 
@@ -267,4 +366,5 @@ def num_desired_volume_replicas():
 def set_num_volume_replicas(num_replicas):
     volumes_api = ApiClient.volumes_api()
     volume = volumes_api.put_volume_replica_count(VOLUME_UUID, num_replicas)
+    invalidate_volume()
     return volume